@@ -4,6 +4,8 @@ import os
 import json
 from pathlib import Path
 import numpy as np
+import datetime
+from unknown_visitors import UnknownVisitorStore
 
 def load_config():
     try:
@@ -21,6 +23,14 @@ def load_config():
                 "welcome_text": "Welcome,",
                 "unknown_text": "Unknown Person",
                 "display_time": 3
+            },
+            "unknown_visitors": {
+                "store_file": "unknown_visitors.json",
+                "cluster_threshold": 0.50,
+                "max_clusters": 500,
+                "expiry_days": 30,
+                "save_every": 20,
+                "save_interval": 60
             }
         }
         try:
@@ -164,6 +174,60 @@ def delete_attendee():
     except ValueError:
         print("\nInvalid input. Please enter a number.")
 
+def promote_unknown_visitor():
+    config = load_config()
+    if not config:
+        return
+
+    store = UnknownVisitorStore(config.get('unknown_visitors', {}))
+    clusters = store.clusters()
+    if not clusters:
+        print("\nNo unknown visitors recorded.")
+        return
+
+    print("\nSelect unknown visitor to promote:")
+    for i, (cluster_id, count, last_seen) in enumerate(clusters, 1):
+        last_seen = datetime.datetime.fromtimestamp(last_seen).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"{i}. {cluster_id} (seen {count} times, last {last_seen})")
+
+    try:
+        choice = int(input("\nEnter number (or 0 to cancel): "))
+    except ValueError:
+        print("\nInvalid input. Please enter a number.")
+        return
+    if choice == 0:
+        return
+    if not 1 <= choice <= len(clusters):
+        print("\nInvalid selection.")
+        return
+
+    cluster_id = clusters[choice-1][0]
+    person_name = input("Enter person's name: ").strip()
+    if not person_name:
+        print("\nInvalid name.")
+        return
+    person_name = person_name.replace(" ", "_").upper()
+
+    centroid = store.promote(cluster_id)
+    if centroid is None:
+        print(f"\n{cluster_id} no longer exists (it may have expired).")
+        return
+
+    encoding_file = 'encodings.json'
+    if os.path.exists(encoding_file):
+        with open(encoding_file, 'r') as f:
+            data = json.load(f)
+    else:
+        data = {}
+
+    data[person_name] = centroid.tolist()
+
+    with open(encoding_file, 'w') as f:
+        json.dump(data, f)
+
+    print(f"\nPromoted {cluster_id} to {person_name}.")
+    print("Restart fras.py to recognise them; a running instance only loads encodings at startup.")
+
 def add_attendee(name, image_path, encoding_file='encodings.json'):
     # Load image and get encoding
     img = cv2.imread(image_path)
@@ -198,7 +262,8 @@ def main():
             print("1. Add New Person")
             print("2. View Registered Attendees")
             print("3. Delete Attendee")
-            print("4. Exit")
+            print("4. Promote Unknown Visitor")
+            print("5. Exit")
             
             choice = input("\nSelect option: ")
             
@@ -209,6 +274,8 @@ def main():
             elif choice == "3":
                 delete_attendee()
             elif choice == "4":
+                promote_unknown_visitor()
+            elif choice == "5":
                 print("\nExiting training system...")
                 break
             else:
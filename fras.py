@@ -1,12 +1,20 @@
 import os
+import copy
 import json
-import numpy as np
-import face_recognition
+import argparse
+import cProfile
+import difflib
+import pstats
 import cv2
 import datetime
 import logging
 import sys
 import time
+import numpy as np
+import pipeline
+from gallery import Gallery
+from recording import FrameRecorder, CaptureReader, RecordedStage
+from unknown_visitors import UnknownVisitorStore
 
 # Configure logging
 logging.basicConfig(
@@ -19,8 +27,9 @@ logging.basicConfig(
 )
 
 class UIOverlay:
-    def __init__(self, config):
+    def __init__(self, config, clock=time.time):
         self.config = config
+        self.clock = clock
         self.message = ""
         self.show_checkmark = False
         self.display_until = 0
@@ -28,10 +37,10 @@ class UIOverlay:
     def set_message(self, message, show_checkmark=False, duration=2):
         self.message = message
         self.show_checkmark = show_checkmark
-        self.display_until = time.time() + duration
+        self.display_until = self.clock() + duration
 
     def should_clear(self):
-        return self.display_until and time.time() > self.display_until
+        return self.display_until and self.clock() > self.display_until
 
     def clear(self):
         self.message = ""
@@ -52,6 +61,31 @@ def load_config():
                 "welcome_text": "Welcome,",
                 "unknown_text": "Unknown Person",
                 "display_time": 2
+            },
+            "unknown_visitors": {
+                "store_file": "unknown_visitors.json",
+                "cluster_threshold": 0.50,
+                "max_clusters": 500,
+                "expiry_days": 30,
+                "save_every": 20,
+                "save_interval": 60
+            },
+            "pipeline": pipeline.DEFAULT_PIPELINE,
+            "gallery": {
+                "quantization": "none",
+                "rerank_top_k": 5,
+                "exact_cache_file": "encodings_exact.npy",
+                "verify_on_load": True,
+                "verify_probes": 200,
+                "verify_capture": None
+            },
+            "recorder": {
+                "directory": "captures",
+                "scale": 0.5,
+                "jpeg_quality": 85,
+                "max_pending_frames": 8,
+                "max_frames": 36000,
+                "max_bytes": 1073741824
             }
         }
         with open('config.json', 'w') as f:
@@ -61,12 +95,21 @@ def load_config():
 class FaceRecognitionSystem:
     def __init__(self, config):
         self.config = config
+        # Replay swaps in the recorded timestamps so timing is deterministic
+        self.clock = time.time
+        self.frame_scale = 1.0  # size of captured frames relative to the camera
         self.classNames = []
-        self.encodeListKnown = []
-        self.ui_overlay = UIOverlay(config)
+        self.gallery = Gallery([], [])
+        self.ui_overlay = UIOverlay(config, lambda: self.clock())
         self.state = "idle"  # idle, analyzing, welcome, unknown, cooldown
         self.state_until = 0
         self.last_detected_name = None
+        self.unknown_visitors = UnknownVisitorStore(config.get('unknown_visitors', {}))
+        self.stages = {}
+        self.frame_count = 0
+        self.sighting = 0  # bumped per detection so stale stage results are dropped
+        self.recognition_result = None
+        self._pending_face_locations = None
         self.load_encodings()
 
     def load_encodings(self):
@@ -77,14 +120,35 @@ class FaceRecognitionSystem:
         with open(encoding_file, 'r') as f:
             data = json.load(f)
         self.classNames = list(data.keys())
-        self.encodeListKnown = [np.array(enc) for enc in data.values()]
-        logging.info(f"Loaded {len(self.classNames)} face encodings.")
+        gallery_config = self.config.get('gallery', {})
+        self.gallery = Gallery(
+            self.classNames, list(data.values()),
+            quantization=gallery_config.get('quantization', 'none'),
+            rerank_top_k=gallery_config.get('rerank_top_k', 5),
+            exact_file=gallery_config.get('exact_cache_file')
+        )
+        logging.info(f"Loaded {len(self.classNames)} face encodings "
+                     f"({self.gallery.quantization} gallery, "
+                     f"{self.gallery.resident_nbytes()} bytes resident).")
+        if gallery_config.get('verify_on_load', True):
+            probes = None
+            if gallery_config.get('verify_capture'):
+                # Real sightings from a recorded session make the best probes
+                try:
+                    probes = CaptureReader(gallery_config['verify_capture']).encodings()
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Could not read verify_capture "
+                                    f"{gallery_config['verify_capture']}, using perturbed "
+                                    f"probes instead: {str(e)}")
+            self.gallery.verify(self.config['face_recognition_threshold'], probes=probes,
+                                max_probes=gallery_config.get('verify_probes', 200))
         return True
 
     def markAttendance(self, name):
         try:
-            current_date = datetime.datetime.now().strftime('%Y-%m-%d')
-            current_time = datetime.datetime.now().strftime('%H:%M:%S')
+            now = datetime.datetime.fromtimestamp(self.clock())
+            current_date = now.strftime('%Y-%m-%d')
+            current_time = now.strftime('%H:%M:%S')
             if not os.path.exists(self.config['attendance_file']):
                 with open(self.config['attendance_file'], 'w') as f:
                     f.write("Name,Date,Time\n")
@@ -120,111 +184,181 @@ class FaceRecognitionSystem:
                         2.0, (0, 255, 0), 3)
         return img
 
-    def run(self):
+    def record_sighting(self, name, encoding, now):
+        """Record stage: mark attendance for a known name, or for the unknown
+        visitor cluster the encoding belongs to."""
+        if name == "Unknown":
+            name = self.unknown_visitors.assign(encoding, now)
+        self.markAttendance(name)
+        return name
+
+    def gate(self, img):
+        """Gate stage: only idle frames, every ``frame_skip``-th one, and only
+        while the detect stage has room are passed on for detection."""
+        if self.state != "idle":
+            return None
+        self.frame_count += 1
+        if self.frame_count % max(1, self.config.get('frame_skip', 1)) != 0:
+            return None
+        if img is None or not self.stages['detect'].has_capacity():
+            return None
+        fx = 0.25 / self.frame_scale
+        small_img = cv2.resize(img, (0, 0), fx=fx, fy=fx)
+        return cv2.cvtColor(small_img, cv2.COLOR_BGR2RGB)
+
+    def process_frame(self, img, now):
+        """Run gate, detect, encode, match and record for one captured frame
+        and advance the state machine. Returns the stage outputs produced on
+        this frame, for the recorder."""
+        detect, encode, match, record = (
+            self.stages['detect'], self.stages['encode'],
+            self.stages['match'], self.stages['record']
+        )
+        outputs = {}
+
+        rgb_small_img = self.gate(img)
+        if rgb_small_img is not None:
+            detect.submit(pipeline.detect_faces, rgb_small_img, context=rgb_small_img)
+
+        for rgb_small_img, face_locations in detect.poll():
+            outputs.setdefault('detect', []).append(face_locations)
+            if self.state == "idle" and face_locations:
+                self.state = "analyzing"
+                self.state_until = now + 1.0  # 1 second analyzing
+                self.ui_overlay.set_message(self.config['ui']['analyzing_text'], False, 1.0)
+                self._pending_face_locations = face_locations
+                self.sighting += 1
+                self.recognition_result = None
+                encode.submit(pipeline.encode_faces, rgb_small_img, face_locations,
+                              context=self.sighting)
+
+        for sighting, face_encodings in encode.poll():
+            if sighting != self.sighting:
+                continue
+            # A failed encode comes back as None; record it as no faces
+            face_encodings = face_encodings or []
+            outputs.setdefault('encode', []).append(face_encodings)
+            if face_encodings:
+                match.submit(pipeline.match_face, face_encodings[0],
+                             self.config['face_recognition_threshold'],
+                             context=(sighting, face_encodings[0]))
+            else:
+                self.recognition_result = ("Unknown", None)
+
+        for (sighting, encoding), name in match.poll():
+            if sighting != self.sighting:
+                continue
+            outputs.setdefault('match', []).append(name)
+            if name is None:
+                # Matching failed, drop this sighting
+                self.state = "idle"
+                self.ui_overlay.clear()
+            else:
+                self.recognition_result = (name, encoding)
+
+        for _, recorded_name in record.poll():
+            outputs.setdefault('record', []).append(recorded_name)
+
+        # State machine
+        if self.state == "analyzing":
+            if now >= self.state_until and self.recognition_result is not None:
+                name, encoding = self.recognition_result
+                if encoding is not None and name != "Unknown":
+                    record.submit(self.record_sighting, name, encoding, now)
+                    self.ui_overlay.set_message(
+                        f"{self.config['ui']['welcome_text']} {name}",
+                        True,
+                        self.config['ui']['display_time']
+                    )
+                    self.state = "welcome"
+                    self.state_until = now + self.config['ui']['display_time']
+                    self.last_detected_name = name
+                else:
+                    if encoding is not None:
+                        record.submit(self.record_sighting, name, encoding, now)
+                    # No encoding found is also shown as unknown, but not recorded
+                    self.ui_overlay.set_message(
+                        self.config['ui']['unknown_text'],
+                        False,
+                        2
+                    )
+                    self.state = "unknown"
+                    self.state_until = now + 2
+            # else: still analyzing, show overlay
+
+        elif self.state in ("welcome", "unknown"):
+            if now >= self.state_until:
+                self.state = "cooldown"
+                self.state_until = now + 2  # 2 seconds cooldown after any detection
+                self.ui_overlay.clear()
+
+        elif self.state == "cooldown":
+            if now >= self.state_until:
+                self.state = "idle"
+            # No overlay
+
+        outputs['state'] = self.state
+        return outputs
+
+    def render(self, img):
+        """Render stage: face boxes, labels and the status overlay."""
+        if self._pending_face_locations and self.state in ("analyzing", "welcome", "unknown"):
+            factor = 4 * self.frame_scale
+            for (top, right, bottom, left) in self._pending_face_locations:
+                top, right, bottom, left = (int(v * factor) for v in (top, right, bottom, left))
+                cv2.rectangle(img, (left, top), (right, bottom), (0, 255, 0), 2)
+                if self.state == "welcome" and self.last_detected_name:
+                    cv2.putText(img, self.last_detected_name, (left, top-10), cv2.FONT_HERSHEY_DUPLEX, 1, (255, 255, 255), 2)
+                elif self.state == "unknown":
+                    cv2.putText(img, "Unknown", (left, top-10), cv2.FONT_HERSHEY_DUPLEX, 1, (0, 0, 255), 2)
+
+        if self.ui_overlay.should_clear():
+            self.ui_overlay.clear()
+        return self.draw_ui(img)
+
+    def capture(self, cap):
+        """Capture stage: keep up to ``queue_depth`` reads queued and return
+        the oldest frame, or None when the camera stops delivering."""
+        capture = self.stages['capture']
+        # Bound on everything queued: inline reads finish immediately and
+        # would never count as in flight
+        while capture.queued() < capture.queue_depth:
+            capture.submit(cap.read)
+        result = capture.next_result()
+        if result is None:
+            return None
+        success, img = result
+        return img if success else None
+
+    def run(self, record=False):
         cap = cv2.VideoCapture(0)
         if not cap.isOpened():
             logging.error("Failed to open webcam.")
             return
 
-        logging.info("Face Recognition Attendance System started.")
+        self.stages = {}
+        recorder = None
         try:
+            # Built inside the try so a bad pipeline or recorder config still
+            # releases the camera
+            self.stages = pipeline.build_stages(
+                self.config.get('pipeline', {}), self.gallery
+            )
+            if record:
+                recorder = FrameRecorder(self.config.get('recorder', {}), self.config)
+            logging.info("Face Recognition Attendance System started.")
             while True:
                 try:
-                    success, img = cap.read()
-                    if not success:
+                    img = self.capture(cap)
+                    if img is None:
                         logging.error("Failed to read frame from webcam.")
                         break
 
-                    now = time.time()
-
-                    # State machine
-                    if self.state == "idle":
-                        # Detect movement/face
-                        small_img = cv2.resize(img, (0, 0), fx=0.25, fy=0.25)
-                        rgb_small_img = cv2.cvtColor(small_img, cv2.COLOR_BGR2RGB)
-                        face_locations = face_recognition.face_locations(rgb_small_img)
-                        if face_locations:
-                            self.state = "analyzing"
-                            self.state_until = now + 1.0  # 1 second analyzing
-                            self.ui_overlay.set_message(self.config['ui']['analyzing_text'], False, 1.0)
-                            self._pending_face_locations = face_locations
-                            self._pending_rgb_img = rgb_small_img
-                        # else: remain idle, no overlay
-
-                    elif self.state == "analyzing":
-                        if now >= self.state_until:
-                            # Do recognition
-                            face_locations = getattr(self, "_pending_face_locations", [])
-                            rgb_small_img = getattr(self, "_pending_rgb_img", None)
-                            name = "Unknown"
-                            if face_locations and rgb_small_img is not None:
-                                face_encodings = face_recognition.face_encodings(rgb_small_img, face_locations)
-                                if face_encodings:
-                                    matches = face_recognition.compare_faces(
-                                        self.encodeListKnown, face_encodings[0], tolerance=self.config['face_recognition_threshold']
-                                    )
-                                    face_distances = face_recognition.face_distance(self.encodeListKnown, face_encodings[0])
-                                    best_match_index = np.argmin(face_distances) if len(face_distances) > 0 else None
-
-                                    if best_match_index is not None and matches[best_match_index]:
-                                        name = self.classNames[best_match_index]
-                                        self.markAttendance(name)
-                                        self.ui_overlay.set_message(
-                                            f"{self.config['ui']['welcome_text']} {name}",
-                                            True,
-                                            self.config['ui']['display_time']
-                                        )
-                                        self.state = "welcome"
-                                        self.state_until = now + self.config['ui']['display_time']
-                                        self.last_detected_name = name
-                                    else:
-                                        self.markAttendance("Unknown")
-                                        self.ui_overlay.set_message(
-                                            self.config['ui']['unknown_text'],
-                                            False,
-                                            2
-                                        )
-                                        self.state = "unknown"
-                                        self.state_until = now + 2
-                                else:
-                                    # No encoding found, treat as unknown
-                                    self.ui_overlay.set_message(
-                                        self.config['ui']['unknown_text'],
-                                        False,
-                                        2
-                                    )
-                                    self.state = "unknown"
-                                    self.state_until = now + 2
-                            else:
-                                self.state = "idle"
-                                self.ui_overlay.clear()
-                    # else: still analyzing, show overlay
-
-                    elif self.state in ("welcome", "unknown"):
-                        if now >= self.state_until:
-                            self.state = "cooldown"
-                            self.state_until = now + 2  # 2 seconds cooldown after any detection
-                            self.ui_overlay.clear()
-
-                    elif self.state == "cooldown":
-                        if now >= self.state_until:
-                            self.state = "idle"
-                        # No overlay
-
-                    # Draw rectangles if face detected
-                    if hasattr(self, "_pending_face_locations") and self.state in ("analyzing", "welcome", "unknown"):
-                        for (top, right, bottom, left) in self._pending_face_locations:
-                            top, right, bottom, left = top*4, right*4, bottom*4, left*4
-                            cv2.rectangle(img, (left, top), (right, bottom), (0, 255, 0), 2)
-                            if self.state == "welcome" and self.last_detected_name:
-                                cv2.putText(img, self.last_detected_name, (left, top-10), cv2.FONT_HERSHEY_DUPLEX, 1, (255, 255, 255), 2)
-                            elif self.state == "unknown":
-                                cv2.putText(img, "Unknown", (left, top-10), cv2.FONT_HERSHEY_DUPLEX, 1, (0, 0, 255), 2)
-
-                    # UI overlay
-                    if self.ui_overlay.should_clear():
-                        self.ui_overlay.clear()
-                    img = self.draw_ui(img)
+                    now = self.clock()
+                    outputs = self.process_frame(img, now)
+                    if recorder:
+                        recorder.write(now, img, outputs)
+                    img = self.render(img)
 
                     cv2.imshow('Face Recognition Attendance', img)
                     if cv2.waitKey(1) & 0xFF == ord('q'):
@@ -240,16 +374,171 @@ class FaceRecognitionSystem:
         except Exception as e:
             logging.error(f"Unexpected error in main loop: {e}", exc_info=True)
         finally:
+            for name, stage in self.stages.items():
+                # Let queued attendance writes finish before flushing the store
+                stage.shutdown(wait=name == 'record')
+            self.unknown_visitors.flush()
+            if recorder:
+                recorder.close()
             cap.release()
             cv2.destroyAllWindows()
             logging.info("Camera released and all windows closed.")
 
+    def replay(self, capture_dir, show=False, from_outputs=False):
+        """Feed a recorded capture back through the pipeline.
+
+        The configuration recorded with the capture replaces the local one
+        and the clock follows the recorded timestamps. By default detect,
+        encode and match are recomputed inline from the recorded frames,
+        which is deterministic and suited to profiling. With
+        ``from_outputs``, those stages instead hand back the outputs recorded
+        on each frame, so the state machine sees results on exactly the
+        frames they arrived on in production, whatever executors were used.
+        Attendance and unknown visitors are written inside the capture
+        directory, never to the live files.
+        """
+        reader = CaptureReader(capture_dir)
+        self.frame_scale = reader.scale
+        if reader.meta.get('config'):
+            self.config = copy.deepcopy(reader.meta['config'])
+            self.ui_overlay.config = self.config
+        else:
+            logging.warning("Capture has no recorded config, using the local config.json.")
+        self.config['attendance_file'] = os.path.join(capture_dir, 'replay_attendance.csv')
+        visitors_config = dict(self.config.get('unknown_visitors', {}))
+        visitors_config['store_file'] = os.path.join(capture_dir, 'replay_unknown_visitors.json')
+        for path in (self.config['attendance_file'], visitors_config['store_file']):
+            if os.path.exists(path):
+                os.remove(path)
+        self.unknown_visitors = UnknownVisitorStore(visitors_config)
+        inline = {stage: {"executor": "inline"} for stage in pipeline.STAGE_EXECUTORS}
+        if from_outputs:
+            self.stages = pipeline.build_stages(inline, self.gallery)
+            for name in ('detect', 'encode', 'match'):
+                self.stages[name] = RecordedStage(name)
+        else:
+            # Match against the local encodings.json with the recorded gallery settings
+            self.config.setdefault('gallery', {})['verify_on_load'] = False
+            self.load_encodings()
+            self.stages = pipeline.build_stages(inline, self.gallery)
+
+        replay_time = [0.0]
+        self.clock = lambda: replay_time[0]
+        # Keyed by frame index so one extra or missing decision does not
+        # shift every later comparison in from_outputs mode
+        recorded_matches, replayed_matches = {}, {}
+        recorded_states, replayed_states = {}, {}
+        logging.info(f"Replaying {len(reader)} frames from {capture_dir}.")
+        try:
+            for event, img in reader:
+                if img is None and not from_outputs:
+                    logging.warning(f"Recorded frame {event['frame']} has no image, skipping.")
+                    continue
+                if from_outputs:
+                    self.stages['detect'].load(event.get('detect', []))
+                    self.stages['encode'].load(
+                        [[np.array(encoding) for encoding in face_encodings or []]
+                         for face_encodings in event.get('encode', [])]
+                    )
+                    self.stages['match'].load(event.get('match', []))
+                replay_time[0] = event['timestamp']
+                outputs = self.process_frame(img, event['timestamp'])
+                frame = event['frame']
+                if event.get('match'):
+                    recorded_matches[frame] = event['match']
+                if outputs.get('match'):
+                    replayed_matches[frame] = outputs['match']
+                recorded_states[frame] = event.get('state')
+                replayed_states[frame] = outputs['state']
+                if show and img is not None:
+                    cv2.imshow('Face Recognition Replay', self.render(img))
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        logging.info("User requested exit with 'q'.")
+                        break
+        finally:
+            for stage in self.stages.values():
+                stage.shutdown(wait=True)
+            self.unknown_visitors.flush()
+            if show:
+                cv2.destroyAllWindows()
+
+        if from_outputs:
+            return self._compare_frames(recorded_matches, replayed_matches,
+                                        recorded_states, replayed_states)
+        return self._compare_decisions(recorded_matches, replayed_matches)
+
+    @staticmethod
+    def _compare_frames(recorded_matches, replayed_matches, recorded_states, replayed_states):
+        """Frame-by-frame comparison, for replays driven by recorded outputs
+        where results land on the same frames as in the recording."""
+        changed = [frame for frame in sorted(set(recorded_matches) | set(replayed_matches))
+                   if recorded_matches.get(frame) != replayed_matches.get(frame)]
+        state_changed = [frame for frame in sorted(replayed_states)
+                         if replayed_states[frame] != recorded_states[frame]]
+        logging.info(f"Replay finished: match decisions on {len(replayed_matches)} frames, "
+                     f"{len(changed)} frames differ from the recording; state differs on "
+                     f"{len(state_changed)} of {len(replayed_states)} frames.")
+        if state_changed:
+            frame = state_changed[0]
+            logging.info(f"First state difference at frame {frame}: recorded "
+                         f"'{recorded_states[frame]}', replayed '{replayed_states[frame]}'.")
+        return len(changed)
+
+    @staticmethod
+    def _compare_decisions(recorded_matches, replayed_matches):
+        """Compare the ordered sequence of match decisions. Recomputed stages
+        run inline, so a decision threaded in production may land a frame or
+        two earlier than recorded; only its order is meaningful."""
+        recorded = [name for frame in sorted(recorded_matches) for name in recorded_matches[frame]]
+        replayed = [name for frame in sorted(replayed_matches) for name in replayed_matches[frame]]
+        differences = [
+            (i1, i2, j1, j2)
+            for tag, i1, i2, j1, j2
+            in difflib.SequenceMatcher(None, recorded, replayed, autojunk=False).get_opcodes()
+            if tag != 'equal'
+        ]
+        changed = sum(max(i2 - i1, j2 - j1) for i1, i2, j1, j2 in differences)
+        logging.info(f"Replay finished: {len(recorded)} match decisions recorded, "
+                     f"{len(replayed)} replayed, {changed} differ.")
+        if differences:
+            i1, i2, j1, j2 = differences[0]
+            logging.info(f"First difference at decision {i1}: recorded {recorded[i1:i2]}, "
+                         f"replayed {replayed[j1:j2]}.")
+        return changed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Face Recognition Attendance System")
+    parser.add_argument('--record', action='store_true',
+                        help="record frames and stage outputs for later replay")
+    parser.add_argument('--replay', metavar='CAPTURE_DIR',
+                        help="replay a recorded capture instead of opening the webcam")
+    parser.add_argument('--replay-outputs', action='store_true',
+                        help="drive the replay from the recorded detect/encode/match "
+                             "outputs instead of recomputing them")
+    parser.add_argument('--show', action='store_true',
+                        help="display frames while replaying")
+    parser.add_argument('--profile', metavar='STATS_FILE',
+                        help="run under cProfile and write stats to this file")
+    return parser.parse_args()
+
 if __name__ == "__main__":
     try:
+        args = parse_args()
         logging.info("Application starting.")
         config = load_config()
         frs = FaceRecognitionSystem(config)
-        frs.run()
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler:
+            profiler.enable()
+        if args.replay:
+            frs.replay(args.replay, show=args.show, from_outputs=args.replay_outputs)
+        else:
+            frs.run(record=args.record)
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+            logging.info(f"Profile written to {args.profile}.")
         logging.info("Application exited normally.")
     except Exception as e:
         logging.error(f"Fatal error on startup: {e}", exc_info=True)
\ No newline at end of file
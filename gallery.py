@@ -0,0 +1,183 @@
+import os
+import logging
+import tempfile
+
+import numpy as np
+
+ENCODING_SIZE = 128
+QUANTIZATIONS = ("none", "float16", "int8")
+
+
+class Gallery:
+    """Known face encodings stored as one contiguous matrix.
+
+    With ``quantization`` set to ``float16`` or ``int8`` (per-dimension
+    scale), the distance scan runs over the quantized copy and only the
+    ``rerank_top_k`` closest candidates are re-ranked with exact float64
+    distances, so the threshold decision is always taken on exact values.
+    When ``exact_file`` is given, the float64 rows are kept in a memory-mapped
+    ``.npy`` file instead of process memory, so only re-ranked rows are paged
+    in and worker processes share them through the page cache.
+    """
+
+    def __init__(self, names, encodings, quantization="none", rerank_top_k=5,
+                 exact_file=None):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown gallery quantization '{quantization}' "
+                f"(allowed: {', '.join(QUANTIZATIONS)})."
+            )
+        self.names = list(names)
+        self.exact = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_SIZE)
+        self.quantization = quantization
+        self.rerank_top_k = max(1, rerank_top_k)
+        self.quantized = None
+        self.scale = None
+        self.exact_file = None
+        if quantization == "float16":
+            self.quantized = self.exact.astype(np.float16)
+        elif quantization == "int8":
+            scale = np.abs(self.exact).max(axis=0) / 127 if len(self.exact) else np.ones(ENCODING_SIZE)
+            scale[scale == 0] = 1.0
+            self.scale = scale.astype(np.float32)
+            self._scale_sq = self.scale ** 2
+            self.quantized = self._quantize_int8(self.exact)
+        if self.quantized is not None and exact_file and len(self.exact):
+            if self._write_exact_file(exact_file):
+                self.exact_file = exact_file
+                self.exact = np.load(exact_file, mmap_mode='r')
+
+    def _write_exact_file(self, exact_file):
+        """Make ``exact_file`` hold the exact rows without modifying a file
+        other processes may have memory-mapped: unchanged content is left
+        alone, new content is written to a temp file and swapped in."""
+        if os.path.exists(exact_file):
+            try:
+                existing = np.load(exact_file, mmap_mode='r')
+                unchanged = (existing.shape == self.exact.shape
+                             and np.array_equal(existing, self.exact))
+                del existing
+                if unchanged:
+                    return True
+            except (OSError, ValueError):
+                pass
+        fd, temp_file = tempfile.mkstemp(
+            suffix='.npy', dir=os.path.dirname(os.path.abspath(exact_file))
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, self.exact)
+            os.replace(temp_file, exact_file)
+        except OSError as e:
+            # e.g. Windows refuses to replace a file that is still mapped
+            logging.warning(f"Could not update {exact_file}, keeping exact "
+                            f"encodings in memory: {str(e)}")
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            return False
+        return True
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.exact_file:
+            # Reopen the memory map in worker processes instead of copying it
+            state['exact'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.exact_file:
+            self.exact = np.load(self.exact_file, mmap_mode='r')
+
+    def __len__(self):
+        return len(self.names)
+
+    def _quantize_int8(self, values):
+        return np.clip(np.rint(values / self.scale), -127, 127).astype(np.int8)
+
+    def _approx_distances(self, encoding):
+        if self.quantization == "float16":
+            diff = np.subtract(self.quantized, encoding.astype(np.float32), dtype=np.float32)
+            return np.einsum('ij,ij->i', diff, diff)
+        diff = np.subtract(self.quantized, self._quantize_int8(encoding), dtype=np.int16)
+        return np.square(diff, dtype=np.float32) @ self._scale_sq
+
+    def exact_distances(self, encoding, rows=None):
+        known = self.exact if rows is None else self.exact[rows]
+        return np.linalg.norm(known - encoding, axis=1)
+
+    def match(self, encoding, threshold, exact=False, exclude=None):
+        """Return (index, distance) of the closest known face, with index None
+        when it is farther than ``threshold``. ``exact`` forces a full float64
+        scan; ``exclude`` leaves one row out of the search."""
+        encoding = np.asarray(encoding, dtype=np.float64)
+        count = len(self.exact) - (exclude is not None)
+        if count <= 0:
+            return None, np.inf
+
+        if exact or self.quantized is None:
+            candidates = None
+            distances = self.exact_distances(encoding)
+            if exclude is not None:
+                distances[exclude] = np.inf
+        else:
+            approx = self._approx_distances(encoding)
+            if exclude is not None:
+                approx[exclude] = np.inf
+            k = min(self.rerank_top_k, count)
+            candidates = np.argpartition(approx, k - 1)[:k]
+            distances = self.exact_distances(encoding, candidates)
+
+        best = int(np.argmin(distances))
+        distance = float(distances[best])
+        if candidates is not None:
+            best = int(candidates[best])
+        return (best if distance <= threshold else None), distance
+
+    def perturbed_probes(self, threshold, count=200, seed=0):
+        """Synthetic sightings of enrolled people: each probe is a sampled
+        enrolled encoding moved in a random direction by 50-100% of
+        ``threshold``, so most decisions sit just inside the match boundary."""
+        rng = np.random.default_rng(seed)
+        rows = rng.integers(0, len(self.exact), count)
+        noise = rng.standard_normal((count, ENCODING_SIZE))
+        noise *= (rng.uniform(0.5, 1.0, count) * threshold
+                  / np.linalg.norm(noise, axis=1))[:, None]
+        return self.exact[rows] + noise
+
+    def verify(self, threshold, probes=None, max_probes=200):
+        """Count match decisions that differ between the quantized path and a
+        full float64 scan.
+
+        Re-ranking uses exact distances, so a decision can only change when
+        the true nearest face is missing from the quantized top
+        ``rerank_top_k``; probes therefore need to be sightings of enrolled
+        people. Pass captured encodings as ``probes``, otherwise
+        ``perturbed_probes`` are used.
+        """
+        if self.quantized is None or not len(self.exact):
+            return 0, 0
+        if probes is None or not len(probes):
+            probes = self.perturbed_probes(threshold, max_probes)
+        probes = probes[:max_probes]
+
+        changed = 0
+        for probe in probes:
+            quantized_index, _ = self.match(probe, threshold)
+            exact_index, _ = self.match(probe, threshold, exact=True)
+            if quantized_index != exact_index:
+                changed += 1
+        logging.info(
+            f"Quantized gallery check ({self.quantization}): {changed} of "
+            f"{len(probes)} decisions differ from float64 at threshold {threshold}."
+        )
+        return changed, len(probes)
+
+    def resident_nbytes(self):
+        """Bytes of encoding data held in process memory."""
+        if self.quantized is None:
+            return self.exact.nbytes
+        total = self.quantized.nbytes
+        if not self.exact_file:
+            total += self.exact.nbytes
+        return total
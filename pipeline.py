@@ -0,0 +1,176 @@
+import logging
+from collections import deque
+from concurrent.futures import (
+    Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+)
+
+# Executors each stage may run on. Capture owns the camera handle, gate and
+# render drive the state machine and the window, and record shares the
+# attendance file and unknown visitor store, so those cannot leave the
+# main process.
+STAGE_EXECUTORS = {
+    "capture": ("inline", "thread"),
+    "gate": ("inline",),
+    "detect": ("inline", "thread", "process"),
+    "encode": ("inline", "thread", "process"),
+    "match": ("inline", "thread", "process"),
+    "record": ("inline", "thread"),
+    "render": ("inline",),
+}
+
+# Stages whose work must stay ordered and never run concurrently with itself
+SINGLE_WORKER_STAGES = ("capture", "record")
+
+DEFAULT_PIPELINE = {
+    "capture": {"executor": "inline", "queue_depth": 1},
+    "gate": {"executor": "inline"},
+    "detect": {"executor": "inline", "workers": 1, "queue_depth": 1},
+    "encode": {"executor": "thread", "workers": 1, "queue_depth": 1},
+    "match": {"executor": "thread", "workers": 1, "queue_depth": 1},
+    "record": {"executor": "inline", "queue_depth": 4},
+    "render": {"executor": "inline"},
+}
+
+# Gallery used by match_face. Set in the main process for inline and thread
+# executors, and by the pool initializer in each worker for process executors.
+_gallery = None
+
+
+def set_gallery(gallery):
+    global _gallery
+    _gallery = gallery
+
+
+# face_recognition is imported inside the stage functions so the executor
+# machinery below can be used without loading dlib; process workers import
+# it on their first call either way.
+def detect_faces(rgb_img):
+    import face_recognition
+    return face_recognition.face_locations(rgb_img)
+
+
+def encode_faces(rgb_img, face_locations):
+    import face_recognition
+    return face_recognition.face_encodings(rgb_img, face_locations)
+
+
+def match_face(encoding, threshold):
+    best_match_index, _ = _gallery.match(encoding, threshold)
+    if best_match_index is None:
+        return "Unknown"
+    return _gallery.names[best_match_index]
+
+
+class InlineExecutor(Executor):
+    """Runs work immediately in the caller and returns a completed future."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class Stage:
+    """One pipeline stage: an executor plus a bounded queue of pending work.
+
+    Results are handed back by ``poll`` in submission order, together with
+    the context they were submitted with, so the caller can drop stale work.
+    """
+
+    def __init__(self, name, executor="inline", workers=1, queue_depth=1,
+                 initializer=None, initargs=()):
+        self.name = name
+        self.executor_kind = executor
+        self.queue_depth = max(1, queue_depth)
+        self._pending = deque()
+        if executor == "inline":
+            self._executor = InlineExecutor()
+        elif executor == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=f"fras-{name}",
+                initializer=initializer, initargs=initargs
+            )
+        else:
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers, initializer=initializer, initargs=initargs
+            )
+
+    def in_flight(self):
+        return sum(1 for _, future in self._pending if not future.done())
+
+    def queued(self):
+        """Submitted work not yet handed back, finished or not."""
+        return len(self._pending)
+
+    def has_capacity(self):
+        return self.in_flight() < self.queue_depth
+
+    def submit(self, fn, *args, context=None):
+        """Queue work, blocking while ``queue_depth`` items are still running."""
+        while not self.has_capacity():
+            running = [future for _, future in self._pending if not future.done()]
+            wait(running, return_when=FIRST_COMPLETED)
+        self._pending.append((context, self._executor.submit(fn, *args)))
+
+    def poll(self):
+        """Return (context, result) for finished work, oldest first. Failed
+        work is logged and returned with a ``None`` result."""
+        results = []
+        while self._pending and self._pending[0][1].done():
+            context, future = self._pending.popleft()
+            results.append((context, self._result(future)))
+        return results
+
+    def next_result(self):
+        """Block until the oldest queued work finishes and return its result."""
+        if not self._pending:
+            return None
+        _, future = self._pending.popleft()
+        return self._result(future)
+
+    def _result(self, future):
+        try:
+            return future.result()
+        except Exception as e:
+            logging.error(f"Error in {self.name} stage: {e}", exc_info=True)
+            return None
+
+    def shutdown(self, wait=False):
+        if not wait:
+            self._pending.clear()
+        self._executor.shutdown(wait=wait)
+
+
+def build_stages(pipeline_config, gallery):
+    """Create the executor-backed stages from the ``pipeline`` config section.
+
+    Gate and render always run inline in the main loop and are only
+    validated here.
+    """
+    set_gallery(gallery)
+    stages = {}
+    for name, allowed in STAGE_EXECUTORS.items():
+        stage_config = dict(DEFAULT_PIPELINE[name])
+        stage_config.update(pipeline_config.get(name, {}))
+        executor = stage_config["executor"]
+        if executor not in allowed:
+            raise ValueError(
+                f"Stage '{name}' cannot use the '{executor}' executor "
+                f"(allowed: {', '.join(allowed)})."
+            )
+        if name in ("gate", "render"):
+            continue
+        workers = 1 if name in SINGLE_WORKER_STAGES else stage_config.get("workers", 1)
+        initializer, initargs = None, ()
+        if name == "match" and executor == "process":
+            initializer, initargs = set_gallery, (gallery,)
+        stages[name] = Stage(
+            name, executor, workers, stage_config.get("queue_depth", 1),
+            initializer, initargs
+        )
+        logging.info(f"Pipeline stage {name}: {executor} executor, "
+                     f"{workers} worker(s), queue depth {stages[name].queue_depth}.")
+    return stages
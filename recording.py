@@ -0,0 +1,193 @@
+import os
+import json
+import queue
+import logging
+import datetime
+import threading
+
+import cv2
+import numpy as np
+
+FRAMES_FILE = "frames.bin"
+EVENTS_FILE = "events.jsonl"
+META_FILE = "meta.json"
+
+
+class FrameRecorder:
+    """Writes a capture directory for offline replay.
+
+    Frames are JPEG-encoded (optionally downscaled) and appended to a single
+    ``frames.bin``; ``events.jsonl`` holds one line per frame with its
+    timestamp, byte range and the stage outputs produced on that frame.
+
+    Encoding and file writes run on a background thread so recording does
+    not change the timing of the loop being recorded. When more than
+    ``max_pending_frames`` frames wait to be encoded, new frames are dropped
+    but their events (timestamp and stage outputs) are still written.
+    Recording stops once ``max_frames`` or ``max_bytes`` is reached.
+    """
+
+    def __init__(self, config, run_config=None):
+        self.scale = config.get("scale", 0.5)
+        if not 0.25 <= self.scale <= 1.0:
+            raise ValueError("Recorder scale must be between 0.25 and 1.0.")
+        self.jpeg_quality = config.get("jpeg_quality", 85)
+        self.max_frames = config.get("max_frames", 36000)
+        self.max_bytes = config.get("max_bytes", 1024 ** 3)
+        self.directory = os.path.join(
+            config.get("directory", "captures"),
+            datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, META_FILE), 'w') as f:
+            json.dump({"scale": self.scale, "config": run_config or {}}, f, indent=4)
+        self._frames = open(os.path.join(self.directory, FRAMES_FILE), 'wb')
+        self._events = open(os.path.join(self.directory, EVENTS_FILE), 'w')
+        self.frame_count = 0
+        self.dropped_frames = 0
+        self.bytes_written = 0
+        self.full = False
+        self._queue = queue.Queue()
+        self._frame_slots = threading.Semaphore(config.get("max_pending_frames", 8))
+        self._writer = threading.Thread(target=self._write_loop, name="fras-recorder", daemon=True)
+        self._writer.start()
+        logging.info(f"Recording frames to {self.directory}.")
+
+    def write(self, timestamp, img, outputs):
+        """Queue a frame and its stage outputs; never blocks the caller."""
+        if self.full:
+            return
+        if self.frame_count >= self.max_frames:
+            self._stop(f"reached max_frames ({self.max_frames})")
+            return
+        frame = None
+        if self._frame_slots.acquire(blocking=False):
+            # The caller draws the overlay onto img right after this call
+            frame = img.copy()
+        else:
+            self.dropped_frames += 1
+        self._queue.put((self.frame_count, timestamp, frame, outputs))
+        self.frame_count += 1
+
+    def _stop(self, reason):
+        if not self.full:
+            self.full = True
+            logging.warning(f"Recording stopped: {reason}.")
+
+    def _encode(self, index, frame):
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, (0, 0), fx=self.scale, fy=self.scale)
+        success, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not success:
+            logging.error(f"Failed to encode frame {index} for recording.")
+            return None
+        return buf.tobytes()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            index, timestamp, frame, outputs = item
+            try:
+                event = {"frame": index, "timestamp": timestamp, "offset": None, "length": 0}
+                if frame is not None:
+                    try:
+                        data = self._encode(index, frame)
+                    finally:
+                        self._frame_slots.release()
+                    if data is not None:
+                        event["offset"] = self._frames.tell()
+                        event["length"] = len(data)
+                        self._frames.write(data)
+                event.update(outputs)
+                line = json.dumps(event, default=_to_json) + "\n"
+                self._events.write(line)
+                self.bytes_written += event["length"] + len(line)
+                if self.bytes_written >= self.max_bytes:
+                    self._stop(f"reached max_bytes ({self.max_bytes})")
+            except Exception as e:
+                logging.error(f"Error writing recorded frame {index}: {str(e)}", exc_info=True)
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        self._frames.close()
+        self._events.close()
+        logging.info(f"Recorded {self.frame_count} frames to {self.directory} "
+                     f"({self.dropped_frames} frames dropped, {self.bytes_written} bytes).")
+
+
+class CaptureReader:
+    """Iterates over a capture directory written by ``FrameRecorder``,
+    yielding (event, frame) pairs in recording order. The frame is None
+    where the recorder dropped it."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE), 'r') as f:
+            self.meta = json.load(f)
+        self.scale = self.meta.get("scale", 1.0)
+        with open(os.path.join(directory, EVENTS_FILE), 'r') as f:
+            self.events = [json.loads(line) for line in f if line.strip()]
+
+    def __len__(self):
+        return len(self.events)
+
+    def encodings(self):
+        """All face encodings produced by the encode stage during recording.
+        Failed encodes are recorded as None by older captures and skipped."""
+        return [np.array(encoding)
+                for event in self.events
+                for face_encodings in event.get("encode", [])
+                for encoding in face_encodings or []]
+
+    def __iter__(self):
+        with open(os.path.join(self.directory, FRAMES_FILE), 'rb') as f:
+            for event in self.events:
+                if event.get("offset") is None:
+                    yield event, None
+                    continue
+                f.seek(event["offset"])
+                buf = np.frombuffer(f.read(event["length"]), dtype=np.uint8)
+                yield event, cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+class RecordedStage:
+    """Stand-in for a pipeline stage that hands back the outputs recorded
+    for the current frame instead of computing them.
+
+    Submissions only remember their context, so results are delivered on
+    exactly the frames they arrived on during recording, whatever executor
+    produced them.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._context = None
+        self._results = []
+
+    def load(self, results):
+        self._results = list(results)
+
+    def has_capacity(self):
+        return True
+
+    def submit(self, fn, *args, context=None):
+        self._context = context
+
+    def poll(self):
+        results = [(self._context, result) for result in self._results]
+        self._results = []
+        return results
+
+    def shutdown(self, wait=False):
+        pass
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
@@ -0,0 +1,63 @@
+import numpy as np
+
+from gallery import Gallery
+
+
+def _near_tie_gallery(rerank_top_k):
+    # int8 scale on dimension 1 is 1.0 because of the third row, so 0.45
+    # rounds to 0 and -0.55 to -1: the quantized scan ranks "A" first for
+    # the probe below although "B" is closer in float64.
+    encodings = np.zeros((3, 128))
+    encodings[0, 1] = 0.45
+    encodings[1, 1] = -0.55
+    encodings[2, 1] = 127.0
+    return Gallery(["A", "B", "C"], encodings, quantization="int8",
+                   rerank_top_k=rerank_top_k)
+
+
+def _probe():
+    probe = np.zeros(128)
+    probe[1] = -0.1
+    return probe
+
+
+def test_verify_reports_changed_decision_without_enough_reranking():
+    gallery = _near_tie_gallery(rerank_top_k=1)
+    assert gallery.match(_probe(), 0.6)[0] == 0
+    assert gallery.match(_probe(), 0.6, exact=True)[0] == 1
+    assert gallery.verify(0.6, probes=[_probe()]) == (1, 1)
+
+
+def test_reranking_restores_exact_decision():
+    gallery = _near_tie_gallery(rerank_top_k=2)
+    assert gallery.match(_probe(), 0.6)[0] == 1
+    assert gallery.verify(0.6, probes=[_probe()]) == (0, 1)
+
+
+def test_perturbed_probes_sit_inside_match_boundary():
+    rng = np.random.default_rng(0)
+    encodings = rng.normal(0, 0.09, (20, 128))
+    gallery = Gallery([str(i) for i in range(20)], encodings, quantization="float16")
+    probes = gallery.perturbed_probes(0.5, count=50)
+    nearest = np.array([gallery.exact_distances(p).min() for p in probes])
+    assert np.all(nearest <= 0.5)
+    assert gallery.verify(0.5, max_probes=50) == (0, 50)
+
+
+def test_exact_file_is_replaced_not_rewritten(tmp_path):
+    exact_file = tmp_path / "exact.npy"
+    rng = np.random.default_rng(1)
+    encodings = rng.normal(0, 0.09, (5, 128))
+    first = Gallery(list("abcde"), encodings, quantization="int8", exact_file=str(exact_file))
+    inode = exact_file.stat().st_ino
+
+    # Same content: the file a previous instance has mapped is left untouched
+    Gallery(list("abcde"), encodings, quantization="int8", exact_file=str(exact_file))
+    assert exact_file.stat().st_ino == inode
+
+    # New content goes to a new file, so the old mapping stays valid
+    Gallery(list("abcdef"), np.vstack([encodings, encodings[:1]]),
+            quantization="int8", exact_file=str(exact_file))
+    assert exact_file.stat().st_ino != inode
+    assert np.array_equal(first.exact, encodings)
+    assert [p.name for p in tmp_path.iterdir()] == ["exact.npy"]
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from pipeline import Stage, build_stages
+
+
+class FakeCamera:
+    def __init__(self):
+        self.reads = 0
+        self._lock = threading.Lock()
+
+    def read(self):
+        with self._lock:
+            self.reads += 1
+            return True, self.reads
+
+
+def _fill_capture(stage, camera):
+    # Same loop as FaceRecognitionSystem.capture
+    while stage.queued() < stage.queue_depth:
+        stage.submit(camera.read)
+    return stage.next_result()
+
+
+@pytest.mark.parametrize("executor", ["inline", "thread"])
+def test_capture_prefetch_is_bounded_by_queue_depth(executor):
+    stage = Stage("capture", executor, queue_depth=3)
+    camera = FakeCamera()
+    try:
+        frames = [_fill_capture(stage, camera)[1] for _ in range(5)]
+        assert frames == [1, 2, 3, 4, 5]
+        # Never more reads than frames consumed plus the prefetch window
+        assert camera.reads <= 5 + 3
+        assert stage.queued() <= 3
+    finally:
+        stage.shutdown(wait=True)
+
+
+def test_default_capture_stage_reads_one_frame_at_a_time():
+    stage = build_stages({}, gallery=None)["capture"]
+    camera = FakeCamera()
+    for expected in range(1, 4):
+        assert _fill_capture(stage, camera) == (True, expected)
+    assert camera.reads == 3
+
+
+@pytest.mark.parametrize("executor", ["inline", "thread"])
+def test_poll_returns_results_in_submission_order_with_context(executor):
+    stage = Stage("encode", executor, queue_depth=2)
+    try:
+        for i in range(4):
+            stage.submit(pow, i, 2, context=i)
+        stage.shutdown(wait=True)
+        assert stage.poll() == [(0, 0), (1, 1), (2, 4), (3, 9)]
+    finally:
+        stage.shutdown(wait=True)
+
+
+def test_failed_work_is_returned_as_none():
+    stage = Stage("match", "inline")
+    stage.submit(int, "not a number", context="ctx")
+    assert stage.poll() == [("ctx", None)]
+
+
+def test_build_stages_rejects_unsafe_executor():
+    with pytest.raises(ValueError):
+        build_stages({"render": {"executor": "thread"}}, gallery=None)
@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+
+from unknown_visitors import UnknownVisitorStore
+
+
+def _offset_encodings(rng, mean, count):
+    # dlib embeddings sit around a non-zero per-dimension mean
+    return mean + rng.normal(0, 0.09, (count, 128))
+
+
+def _mean_candidates(store, probes):
+    return np.mean([len(store._candidates(store._hash(p))) for p in probes])
+
+
+def test_candidate_count_stays_flat_as_store_grows(tmp_path):
+    rng = np.random.default_rng(1)
+    mean = rng.normal(0, 0.1, 128)
+    candidates = {}
+    for size in (250, 1000, 4000):
+        store = UnknownVisitorStore({
+            "store_file": str(tmp_path / f"store_{size}.json"),
+            "max_clusters": size,
+        })
+        for i, encoding in enumerate(_offset_encodings(rng, mean, size)):
+            store.assign(encoding, now=i, save=False)
+        candidates[size] = _mean_candidates(store, _offset_encodings(rng, mean, 200))
+
+    # 16x more clusters must not mean proportionally more comparisons
+    assert candidates[4000] < 2 * candidates[250]
+    assert candidates[4000] / 4000 < 0.05
+
+
+def test_resighting_keeps_pseudo_id(tmp_path):
+    rng = np.random.default_rng(2)
+    mean = rng.normal(0, 0.1, 128)
+    store = UnknownVisitorStore({"store_file": str(tmp_path / "store.json"),
+                                 "max_clusters": 500})
+    encodings = _offset_encodings(rng, mean, 500)
+    ids = [store.assign(encoding, now=i, save=False) for i, encoding in enumerate(encodings)]
+
+    noise = rng.normal(0, 1, (50, 128))
+    noise *= 0.2 / np.linalg.norm(noise, axis=1, keepdims=True)
+    resighted = [store.assign(encodings[i] + noise[i], now=1000, save=False) for i in range(50)]
+    assert resighted == ids[:50]
+
+
+def test_store_is_saved_in_batches(tmp_path):
+    store_file = tmp_path / "store.json"
+    store = UnknownVisitorStore({"store_file": str(store_file),
+                                 "save_every": 3, "save_interval": 60})
+    rng = np.random.default_rng(3)
+    now = time.time()
+    for encoding in rng.normal(0, 0.09, (2, 128)):
+        store.assign(encoding, now=now)
+    assert not store_file.exists()
+
+    store.assign(rng.normal(0, 0.09, 128), now=now)
+    assert store_file.exists()
+
+    store.assign(rng.normal(0, 0.09, 128), now=now)
+    store.flush()
+    assert len(UnknownVisitorStore({"store_file": str(store_file)}).clusters()) == 4
+
+
+def test_promoted_cluster_is_not_restored_by_running_store(tmp_path):
+    config = {"store_file": str(tmp_path / "store.json")}
+    rng = np.random.default_rng(4)
+    now = time.time()
+    running = UnknownVisitorStore(config)
+    promoted_id = running.assign(rng.normal(0, 0.09, 128), now=now)
+    running.flush()
+
+    centroid = UnknownVisitorStore(config).promote(promoted_id)
+    assert centroid is not None
+
+    # The running instance still holds the cluster and saves later on
+    running.assign(rng.normal(0, 0.09, 128), now=now)
+    running.flush()
+    assert promoted_id not in [c[0] for c in running.clusters()]
+    assert promoted_id not in [c[0] for c in UnknownVisitorStore(config).clusters()]
@@ -0,0 +1,309 @@
+import os
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+ENCODING_SIZE = 128
+# Clusters inserted before the hash centre is first estimated
+MIN_RECENTRE_INTERVAL = 16
+
+
+class UnknownVisitorStore:
+    """Bounded store that groups unknown face encodings into stable pseudo-IDs.
+
+    Each cluster keeps only a running-mean centroid, so memory is bounded by
+    ``max_clusters``. Candidate clusters for a new encoding are found through
+    random-hyperplane hash tables, so only the clusters sharing a bucket with
+    the encoding are compared instead of the whole store.
+
+    Face encodings are not centred on the origin, so hashing is done
+    relative to the mean centroid; otherwise most hyperplanes miss the data
+    and a few buckets hold a large share of the store. The bits per table
+    grow with ``max_clusters`` to keep bucket occupancy bounded.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.store_file = config.get("store_file", "unknown_visitors.json")
+        self.threshold = config.get("cluster_threshold", 0.50)
+        self.max_clusters = config.get("max_clusters", 500)
+        self.expiry_seconds = config.get("expiry_days", 30) * 86400
+        # Rewriting the store is O(N), so it is batched rather than per sighting
+        self.save_every = config.get("save_every", 20)
+        self.save_interval = config.get("save_interval", 60)
+        self.hash_tables = config.get("hash_tables", 10)
+        # About four clusters per bucket when the store is full
+        self.hash_bits = config.get("hash_bits") or max(
+            4, math.ceil(math.log2(max(self.max_clusters, 2))) - 2
+        )
+
+        # Fixed seed so that bucket keys stay the same across restarts
+        rng = np.random.default_rng(config.get("hash_seed", 0))
+        self._planes = rng.standard_normal(
+            (self.hash_tables * self.hash_bits, ENCODING_SIZE)
+        )
+        self._bit_weights = 1 << np.arange(self.hash_bits)
+        self._reset()
+        self.load()
+
+    def _reset(self):
+        self._center = np.zeros(ENCODING_SIZE)
+        self._inserts_since_recentre = 0
+        self._recentre_interval = MIN_RECENTRE_INTERVAL
+        self._centroids = np.zeros((self.max_clusters, ENCODING_SIZE))
+        self._slot_ids = [None] * self.max_clusters
+        self._free_slots = list(range(self.max_clusters - 1, -1, -1))
+        self._buckets = [{} for _ in range(self.hash_tables)]
+        # cluster id -> metadata, ordered from least to most recently seen
+        self._clusters = OrderedDict()
+        self._next_id = 1
+        # Promoted cluster ids, kept in the file so that another process
+        # holding the store in memory drops them instead of saving them back
+        self._promoted = []
+        self._unsaved_changes = 0
+        self._first_unsaved = None
+
+    def _hash(self, encoding):
+        bits = (self._planes @ (encoding - self._center) > 0).reshape(self.hash_tables, self.hash_bits)
+        return (bits @ self._bit_weights).tolist()
+
+    def _recentre(self):
+        """Move the hash centre to the mean centroid and rebuild the buckets.
+
+        The rebuild is O(N), but it only runs after as many new clusters as
+        the store held at the previous rebuild, so it is O(1) amortized.
+        """
+        self._inserts_since_recentre = 0
+        self._recentre_interval = max(MIN_RECENTRE_INTERVAL, len(self._clusters))
+        if not self._clusters:
+            return
+        slots = np.fromiter((c["slot"] for c in self._clusters.values()),
+                            dtype=np.intp, count=len(self._clusters))
+        self._center = self._centroids[slots].mean(axis=0)
+        bits = (self._centroids[slots] - self._center) @ self._planes.T > 0
+        keys = bits.reshape(len(slots), self.hash_tables, self.hash_bits) @ self._bit_weights
+        self._buckets = [{} for _ in range(self.hash_tables)]
+        for cluster_id, cluster_keys in zip(self._clusters, keys.tolist()):
+            self._clusters[cluster_id]["keys"] = cluster_keys
+            self._index(cluster_id, cluster_keys)
+
+    def _index(self, cluster_id, keys):
+        slot = self._clusters[cluster_id]["slot"]
+        for table, key in zip(self._buckets, keys):
+            table.setdefault(key, set()).add(slot)
+
+    def _unindex(self, cluster_id):
+        cluster = self._clusters[cluster_id]
+        for table, key in zip(self._buckets, cluster["keys"]):
+            bucket = table.get(key)
+            if bucket is not None:
+                bucket.discard(cluster["slot"])
+                if not bucket:
+                    del table[key]
+
+    def _insert(self, cluster_id, centroid, count, first_seen, last_seen):
+        slot = self._free_slots.pop()
+        self._centroids[slot] = centroid
+        self._slot_ids[slot] = cluster_id
+        keys = self._hash(centroid)
+        self._clusters[cluster_id] = {
+            "slot": slot,
+            "keys": keys,
+            "count": count,
+            "first_seen": first_seen,
+            "last_seen": last_seen,
+        }
+        self._index(cluster_id, keys)
+
+    def remove(self, cluster_id):
+        if cluster_id not in self._clusters:
+            return False
+        self._unindex(cluster_id)
+        cluster = self._clusters.pop(cluster_id)
+        self._slot_ids[cluster["slot"]] = None
+        self._free_slots.append(cluster["slot"])
+        return True
+
+    def expire(self, now=None):
+        """Drop clusters not seen within the expiry window. Oldest first, so
+        this stops at the first cluster that is still fresh."""
+        now = time.time() if now is None else now
+        expired = []
+        while self._clusters:
+            cluster_id, cluster = next(iter(self._clusters.items()))
+            if now - cluster["last_seen"] <= self.expiry_seconds:
+                break
+            self.remove(cluster_id)
+            expired.append(cluster_id)
+        if expired:
+            logging.info(f"Expired {len(expired)} unknown visitor clusters.")
+        return expired
+
+    def _candidates(self, keys):
+        slots = set()
+        for table, key in zip(self._buckets, keys):
+            slots.update(table.get(key, ()))
+        return slots
+
+    def assign(self, encoding, now=None, save=True):
+        """Return the pseudo-ID for an unknown encoding, creating a new
+        cluster when no stored cluster is within ``cluster_threshold``.
+
+        With ``save``, the store is written once ``save_every`` changes or
+        ``save_interval`` seconds have accumulated; call ``flush`` on exit.
+        """
+        now = time.time() if now is None else now
+        encoding = np.asarray(encoding, dtype=np.float64)
+        self.expire(now)
+
+        keys = self._hash(encoding)
+        slots = self._candidates(keys)
+        cluster_id = None
+        if slots:
+            slot_list = np.fromiter(slots, dtype=np.intp, count=len(slots))
+            distances = np.linalg.norm(self._centroids[slot_list] - encoding, axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] <= self.threshold:
+                cluster_id = self._slot_ids[slot_list[best]]
+
+        if cluster_id is not None:
+            cluster = self._clusters[cluster_id]
+            slot = cluster["slot"]
+            cluster["count"] += 1
+            cluster["last_seen"] = now
+            # Running mean keeps the centroid stable as sightings accumulate
+            self._centroids[slot] += (encoding - self._centroids[slot]) / cluster["count"]
+            new_keys = self._hash(self._centroids[slot])
+            if new_keys != cluster["keys"]:
+                self._unindex(cluster_id)
+                cluster["keys"] = new_keys
+                self._index(cluster_id, new_keys)
+            self._clusters.move_to_end(cluster_id)
+        else:
+            if not self._free_slots:
+                evicted, _ = next(iter(self._clusters.items()))
+                self.remove(evicted)
+                logging.info(f"Unknown visitor store full, evicted {evicted}.")
+            cluster_id = f"UNKNOWN_{self._next_id:04d}"
+            self._next_id += 1
+            self._insert(cluster_id, encoding, 1, now, now)
+            logging.info(f"New unknown visitor cluster {cluster_id}.")
+            self._inserts_since_recentre += 1
+            if self._inserts_since_recentre >= self._recentre_interval:
+                self._recentre()
+
+        if save:
+            self._unsaved_changes += 1
+            if self._first_unsaved is None:
+                self._first_unsaved = now
+            if (self._unsaved_changes >= self.save_every
+                    or now - self._first_unsaved >= self.save_interval):
+                self.save()
+        return cluster_id
+
+    def flush(self):
+        """Write any changes not yet saved."""
+        if self._unsaved_changes:
+            self.save()
+
+    def clusters(self):
+        """Return (cluster_id, count, last_seen) for every stored cluster,
+        most recently seen first."""
+        return [(cid, c["count"], c["last_seen"])
+                for cid, c in reversed(self._clusters.items())]
+
+    def promote(self, cluster_id):
+        """Remove a cluster that has become a named attendee and return its
+        centroid, or None if it no longer exists.
+
+        The store is reloaded first so that changes saved by a running
+        ``fras.py`` are not lost, and the id is recorded as promoted so that
+        process drops the cluster on its next save instead of restoring it.
+        """
+        self._reset()
+        self.load()
+        centroid = self.centroid(cluster_id)
+        if centroid is None:
+            return None
+        self.remove(cluster_id)
+        self._promoted.append(cluster_id)
+        self.save()
+        return centroid
+
+    def _read_file(self):
+        try:
+            with open(self.store_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading {self.store_file}: {str(e)}")
+            return None
+
+    def centroid(self, cluster_id):
+        cluster = self._clusters.get(cluster_id)
+        if cluster is None:
+            return None
+        return self._centroids[cluster["slot"]].copy()
+
+    def load(self):
+        if not os.path.exists(self.store_file):
+            return False
+        data = self._read_file()
+        if data is None:
+            return False
+        self._next_id = data.get("next_id", 1)
+        self._promoted = data.get("promoted", [])
+        if "center" in data:
+            self._center = np.array(data["center"])
+        clusters = sorted(data.get("clusters", {}).items(),
+                          key=lambda item: item[1]["last_seen"])
+        # Keep the most recently seen clusters if the bound was lowered
+        for cluster_id, c in clusters[-self.max_clusters:]:
+            if cluster_id in self._promoted:
+                continue
+            self._insert(cluster_id, np.array(c["centroid"]), c["count"],
+                         c["first_seen"], c["last_seen"])
+        self.expire()
+        if "center" not in data:
+            self._recentre()
+        logging.info(f"Loaded {len(self._clusters)} unknown visitor clusters.")
+        return True
+
+    def save(self):
+        if os.path.exists(self.store_file):
+            on_disk = self._read_file() or {}
+            for cluster_id in on_disk.get("promoted", []):
+                if cluster_id not in self._promoted:
+                    self._promoted.append(cluster_id)
+                    if self.remove(cluster_id):
+                        logging.info(f"Dropped {cluster_id}, promoted to a named attendee.")
+            # Ids are never reused, so old entries only need to outlive the
+            # clusters another process could still hold
+            self._promoted = self._promoted[-self.max_clusters:]
+        data = {
+            "next_id": self._next_id,
+            "promoted": self._promoted,
+            "center": self._center.tolist(),
+            "clusters": {
+                cluster_id: {
+                    "centroid": self._centroids[c["slot"]].tolist(),
+                    "count": c["count"],
+                    "first_seen": c["first_seen"],
+                    "last_seen": c["last_seen"],
+                }
+                for cluster_id, c in self._clusters.items()
+            },
+        }
+        temp_file = f"{self.store_file}.tmp"
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_file, self.store_file)
+        except OSError as e:
+            logging.error(f"Error saving {self.store_file}: {str(e)}")
+            return
+        self._unsaved_changes = 0
+        self._first_unsaved = None